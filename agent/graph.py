@@ -1,131 +1,386 @@
+import hashlib
+import json
+import logging
+import re
+import time
+from functools import lru_cache
+from itertools import chain
+
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from typing import Annotated, List, Literal
+from langgraph.types import Send
+from typing import Annotated, List, Literal, TypedDict
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from llm_provider import llm_provider
 from pydantic import BaseModel, Field
 
 from agent.architect.graph import swe_architect
 from agent.developer.graph import swe_developer
 from agent.analyst.graph import sql_analyst
 from agent.analyst.state import SQLAnalysisResult
+from agent.state_types import ImplementationPlanStruct, plan_encoder, plan_from_payload, plan_to_payload
+from config import CODE_KEYWORDS, SQL_KEYWORDS, cfg, pick_model
 
-class CollaborativeState(BaseModel):
-    """State for collaborative multi-agent workflows"""
-    implementation_research_scratchpad: Annotated[List[BaseMessage], add_messages] = Field(default_factory=list)
-    
-    # Architect outputs
-    research_summary: str = ""
-    implementation_plan: dict = Field(default_factory=dict)
-    collaboration_plan: dict = Field(default_factory=dict)
-    
-    # SQL Analyst outputs  
-    sql_analysis_result: SQLAnalysisResult = None
-    
-    # Shared context between agents
-    sql_queries: List[str] = Field(default_factory=list)
-    database_schema: str = ""
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
-def enhanced_architect(state: CollaborativeState):
-    """Architect analyzes requirements and decides on collaboration strategy"""
-    
-    # Enhanced prompt for the architect to make collaboration decisions
-    if state.implementation_research_scratchpad:
-        original_content = state.implementation_research_scratchpad[-1].content
-    else:
-        original_content = "No specific requirements provided"
-    
-    enhanced_message = HumanMessage(content=f"""
-    {original_content}
-    
-    COLLABORATION ANALYSIS INSTRUCTIONS:
-    Please analyze this request and determine what type of work is needed:
-    
-    1. If SQL/database analysis is needed, mark tasks with [SQL_REQUIRED]
-    2. If software development is needed, mark tasks with [CODE_REQUIRED]  
-    3. If both are needed, plan how they should work together
-    
-    Consider these indicators:
-    - SQL needed: dashboards, analytics, reports, data visualization, database queries, KPIs, metrics
-    - Code needed: applications, APIs, web development, implementation, software features
-    - Both needed: data-driven applications, analytics dashboards, reporting systems
-    
-    Create a clear implementation plan that shows:
-    - What data analysis/SQL work is needed (if any)
-    - What software development work is needed (if any)  
-    - How they should collaborate (if both are needed)
-    """)
-    
-    # Call architect with enhanced message
-    enhanced_state = {
-        "implementation_research_scratchpad": [enhanced_message]
-    }
-    
-    result = swe_architect.invoke(enhanced_state)
-    
-    # Analyze the architect's plan to determine collaboration strategy
-    plan_text = str(result.get('implementation_plan', ''))
-    research_text = str(result.get('research_summary', ''))
-    
-    needs_sql = '[SQL_REQUIRED]' in plan_text or any(
-        keyword in (plan_text + research_text).lower() 
-        for keyword in ['sql', 'query', 'database', 'data analysis', 'analytics', 'dashboard', 'report']
-    )
-    
-    needs_code = '[CODE_REQUIRED]' in plan_text or any(
-        keyword in (plan_text + research_text).lower()
-        for keyword in ['implement', 'develop', 'code', 'application', 'api', 'web', 'software']
-    )
-    
-    # Determine collaboration strategy
+logger = logging.getLogger(__name__)
+
+# Precompiled keyword matchers for SQL/code classification, built from
+# config's single-source keyword tuples (shared with pick_model) so the
+# matchers cannot diverge
+_SQL_KEYWORDS_RE = re.compile(r'\b(%s)\b' % '|'.join(SQL_KEYWORDS), re.IGNORECASE)
+_CODE_KEYWORDS_RE = re.compile(r'\b(%s)\b' % '|'.join(CODE_KEYWORDS), re.IGNORECASE)
+
+# With pyahocorasick installed, both categories resolve in a single pass over
+# the text instead of one scan per regex
+if ahocorasick is not None:
+    _KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for _keyword in SQL_KEYWORDS:
+        _KEYWORD_AUTOMATON.add_word(_keyword, (_keyword, "sql"))
+    for _keyword in CODE_KEYWORDS:
+        _KEYWORD_AUTOMATON.add_word(_keyword, (_keyword, "code"))
+    _KEYWORD_AUTOMATON.make_automaton()
+else:
+    _KEYWORD_AUTOMATON = None
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+def _classify_keywords(text: str):
+    """Resolve (matches_sql, matches_code) for the text, in one automaton pass
+    when the C extension is available and via the compiled regexes otherwise.
+    Automaton hits are filtered on both neighbouring characters so the two
+    backends enforce the same word boundaries and classify identically"""
+    if _KEYWORD_AUTOMATON is not None:
+        lowered = text.lower()
+        found = set()
+        for end_index, (keyword, category) in _KEYWORD_AUTOMATON.iter(lowered):
+            if category in found:
+                continue
+            start_index = end_index - len(keyword) + 1
+            if start_index > 0 and _is_word_char(lowered[start_index - 1]):
+                continue
+            if end_index + 1 < len(lowered) and _is_word_char(lowered[end_index + 1]):
+                continue
+            found.add(category)
+            if len(found) == 2:
+                break
+        return "sql" in found, "code" in found
+    return bool(_SQL_KEYWORDS_RE.search(text)), bool(_CODE_KEYWORDS_RE.search(text))
+
+# Requests shorter than this with a clear keyword signal skip the architect LLM call
+_FAST_CLASSIFY_MAX_CHARS = 280
+
+
+def _classify_fast(text: str):
+    """Classify a request as SQL and/or code work from keywords alone.
+
+    Returns (needs_sql, needs_code, confident). confident is True only when
+    the text is short and at least one keyword list matched, meaning the
+    routing decision is already unambiguous without the architect LLM.
+    """
+    needs_sql, needs_code = _classify_keywords(text)
+    confident = len(text) < _FAST_CLASSIFY_MAX_CHARS and (needs_sql or needs_code)
+    return needs_sql, needs_code, confident
+
+
+# Static instruction blocks, kept byte-identical across calls so provider-side
+# prompt caching hits (explicit cache_control on Anthropic, automatic prefix
+# caching on OpenAI)
+_ARCHITECT_INSTRUCTIONS = """COLLABORATION ANALYSIS INSTRUCTIONS:
+Please analyze this request and determine what type of work is needed:
+
+1. If SQL/database analysis is needed, mark tasks with [SQL_REQUIRED]
+2. If software development is needed, mark tasks with [CODE_REQUIRED]
+3. If both are needed, plan how they should work together
+
+Consider these indicators:
+- SQL needed: dashboards, analytics, reports, data visualization, database queries, KPIs, metrics
+- Code needed: applications, APIs, web development, implementation, software features
+- Both needed: data-driven applications, analytics dashboards, reporting systems
+
+Create a clear implementation plan that shows:
+- What data analysis/SQL work is needed (if any)
+- What software development work is needed (if any)
+- How they should collaborate (if both are needed)"""
+
+_SQL_INTEGRATION_INSTRUCTIONS = """INTEGRATION INSTRUCTIONS:
+- Use the SQL query below in your implementation
+- Consider the data structure returned by this query
+- Implement proper error handling for database operations
+- Add data validation and transformation as needed"""
+
+_CLASSIFY_INSTRUCTIONS = """Classify the request below. Answer only whether it needs SQL/database \
+analysis work and whether it needs software development work."""
+
+
+class CollaborationClassification(BaseModel):
+    needs_sql: bool = Field(description="Whether the request needs SQL/database analysis work")
+    needs_code: bool = Field(description="Whether the request needs software development work")
+
+
+# Cheap routing classifier: one or two output tokens per field, one to two
+# orders of magnitude cheaper than running the full architect graph
+classify_collaboration_runnable = llm_provider.get_llm().with_structured_output(CollaborationClassification)
+
+
+def _plan_to_text(implementation_plan) -> str:
+    """Serialize the implementation plan as canonical compact JSON:
+    deterministic bytes (keeps prompt prefixes cacheable) and smaller than repr()"""
+    if isinstance(implementation_plan, ImplementationPlanStruct):
+        return plan_encoder.encode(implementation_plan).decode()
+    return json.dumps(implementation_plan, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _plan_is_populated(implementation_plan) -> bool:
+    """Whether the plan carries any tasks worth handing to the developer"""
+    if isinstance(implementation_plan, ImplementationPlanStruct):
+        return bool(implementation_plan.tasks)
+    return bool(implementation_plan)
+
+
+def _uses_anthropic_model() -> bool:
+    return "claude" in getattr(cfg, "MODEL_NAME", "").lower()
+
+
+def _message_with_cached_prefix(message_cls, static_prefix: str, dynamic_content: str):
+    """Build a message with the stable instruction block strictly before the
+    dynamic content. On Anthropic models the prefix is marked with an
+    ephemeral cache_control block; elsewhere the byte-stable prefix is enough
+    for the provider's automatic prefix cache to hit"""
+    if _uses_anthropic_model():
+        return message_cls(content=[
+            {"type": "text", "text": static_prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": dynamic_content},
+        ])
+    return message_cls(content=f"{static_prefix}\n\n{dynamic_content}")
+
+
+class _TTLCache:
+    """Minimal TTL cache with insertion-order eviction, shared by the
+    architect and SQL analyst node caches"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = {}
+        self._maxsize = maxsize
+        self._ttl = ttl
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() > expires_at:
+            del self._entries[key]
+            return None
+        return value
+
+    def put(self, key, value):
+        if len(self._entries) >= self._maxsize:
+            # Evict the oldest entry; insertion order approximates LRU well enough here
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (time.monotonic() + self._ttl, value)
+
+
+def _content_cache_key(*parts: str) -> str:
+    return hashlib.blake2b("||".join(parts).encode(), digest_size=16).hexdigest()
+
+
+# Architect decision cache: content hash -> outputs, so burst retries and
+# repeated demo runs skip the architect LLM call entirely
+_architect_cache = _TTLCache(maxsize=512, ttl=600)
+
+# SQL analyst result cache: (requirements, schema) hash -> outputs; a hit
+# skips the whole analyst LLM graph
+_sql_analyst_cache = _TTLCache(maxsize=256, ttl=getattr(cfg, "SQL_CACHE_TTL", 3600))
+
+
+def _last_user_content(state) -> str:
+    """Content of the newest scratchpad message, resolved with a single state
+    lookup so nodes don't repeat the guarded indexing"""
+    scratchpad = state.get("implementation_research_scratchpad")
+    return scratchpad[-1].content if scratchpad else ""
+
+
+def _build_collaboration_plan(needs_sql: bool, needs_code: bool) -> dict:
+    """Build the collaboration plan dict from the SQL/code classification"""
     if needs_sql and needs_code:
-        collaboration_plan = {
+        return {
             "strategy": "collaborative",
             "steps": [
                 "1. SQL Analyst: Analyze data requirements and create optimized queries",
-                "2. Pass SQL results to Developer", 
+                "2. Pass SQL results to Developer",
                 "3. Developer: Implement application using SQL queries"
             ]
         }
     elif needs_sql:
-        collaboration_plan = {
+        return {
             "strategy": "sql_only",
             "steps": ["1. SQL Analyst: Complete data analysis"]
         }
     elif needs_code:
-        collaboration_plan = {
-            "strategy": "code_only", 
+        return {
+            "strategy": "code_only",
             "steps": ["1. Developer: Implement software solution"]
         }
     else:
-        collaboration_plan = {
+        return {
             "strategy": "code_only",
             "steps": ["1. Developer: Implement basic solution"]
         }
+
+class CollaborativeState(TypedDict, total=False):
+    """State for collaborative multi-agent workflows.
+
+    A TypedDict rather than a pydantic model: LangGraph re-validates
+    BaseModel state on every node boundary, which is O(scratchpad) pure
+    overhead per hop. Scalars are plain overwrites; the scratchpad keeps
+    its add_messages reducer.
+    """
+    implementation_research_scratchpad: Annotated[List[BaseMessage], add_messages]
+
+    # Architect outputs
+    research_summary: str
+    implementation_plan: ImplementationPlanStruct
+    collaboration_plan: dict
+
+    # Turn-local renders of the architect outputs, produced once in
+    # enhanced_architect so downstream nodes don't re-serialize the plan
+    rendered_plan_text: str
+    rendered_research_text: str
+
+    # SQL Analyst outputs
+    sql_analysis_result: SQLAnalysisResult
+
+    # Shared context between agents
+    sql_queries: List[str]
+    database_schema: str
+
+    # Set to force a fresh SQL analysis instead of a cached result
+    bypass_cache: bool
+
+async def enhanced_architect(state: CollaborativeState):
+    """Architect analyzes requirements and decides on collaboration strategy"""
+    
+    # Enhanced prompt for the architect to make collaboration decisions
+    original_content = _last_user_content(state) or "No specific requirements provided"
+
+    # Fast path: for short requests whose keywords already resolve the routing
+    # decision, skip the architect LLM round-trip. Only the sql_only outcome
+    # may short-circuit: the developer nodes are plan-driven (they index
+    # implementation_plan.tasks), so any request involving code must fall
+    # through to the architect for a real plan
+    needs_sql, needs_code, confident = _classify_fast(original_content)
+    if confident and needs_sql and not needs_code:
+        return {
+            "research_summary": "",
+            "implementation_plan": ImplementationPlanStruct(),
+            "collaboration_plan": _build_collaboration_plan(True, False),
+            "rendered_plan_text": "",
+            "rendered_research_text": ""
+        }
+
+    # Same request text seen recently: reuse the architect's decision
+    cache_enabled = getattr(cfg, "ARCHITECT_CACHE_ENABLED", True)
+    cache_key = _content_cache_key(original_content)
+    if cache_enabled:
+        cached = _architect_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Architect cache hit for {cache_key}, "
+                        f"saved one architect LLM call (~{len(original_content) // 4} prompt tokens)")
+            return cached
+        logger.info(f"Architect cache miss for {cache_key}")
+
+    # Phase 1: a cheap classification call resolves the strategy when the
+    # keyword fast path could not
+    classification = await classify_collaboration_runnable.ainvoke(
+        [_message_with_cached_prefix(HumanMessage, _CLASSIFY_INSTRUCTIONS, original_content)],
+        config={"configurable": {"model_name": cfg.MODEL_NAME_SIMPLE}})
+
+    # Phase 2: the full architect graph only runs when its implementation plan
+    # is consumed downstream (the developer is involved). sql_only work
+    # discards the plan, so skip the expensive call and route directly
+    if classification.needs_sql and not classification.needs_code:
+        outputs = {
+            "research_summary": "",
+            "implementation_plan": ImplementationPlanStruct(),
+            "collaboration_plan": _build_collaboration_plan(True, False),
+            "rendered_plan_text": "",
+            "rendered_research_text": ""
+        }
+        if cache_enabled:
+            _architect_cache.put(cache_key, outputs)
+        return outputs
+
+    enhanced_message = _message_with_cached_prefix(
+        HumanMessage, _ARCHITECT_INSTRUCTIONS, original_content)
     
-    return {
+    # Call architect with enhanced message
+    enhanced_state = {
+        "implementation_research_scratchpad": [enhanced_message]
+    }
+    
+    # Stream state snapshots instead of buffering the whole run: tokens and
+    # intermediate values surface to astream_events consumers as they arrive,
+    # while routing below only needs the final snapshot
+    result = {}
+    async for snapshot in swe_architect.astream(
+            enhanced_state,
+            config={"configurable": {"model_name": pick_model(original_content)}},
+            stream_mode="values"):
+        result = snapshot
+    
+    # Analyze the architect's plan to determine collaboration strategy.
+    # Single pass per precompiled regex (re.IGNORECASE), no lowercase copy
+    plan_text = str(result.get('implementation_plan', ''))
+    research_text = str(result.get('research_summary', ''))
+    haystack = plan_text + " " + research_text
+    matches_sql, matches_code = _classify_keywords(haystack)
+
+    needs_sql = classification.needs_sql or '[SQL_REQUIRED]' in plan_text or matches_sql
+    needs_code = classification.needs_code or '[CODE_REQUIRED]' in plan_text or matches_code
+    
+    implementation_plan = plan_from_payload(result.get('implementation_plan'))
+    outputs = {
         "research_summary": result.get('research_summary', ''),
-        "implementation_plan": result.get('implementation_plan', {}),
-        "collaboration_plan": collaboration_plan
+        "implementation_plan": implementation_plan,
+        "collaboration_plan": _build_collaboration_plan(needs_sql, needs_code),
+        # Render once; sql_analyst_step and the developer context reuse these
+        "rendered_plan_text": _plan_to_text(implementation_plan),
+        "rendered_research_text": research_text
     }
 
+    if cache_enabled:
+        _architect_cache.put(cache_key, outputs)
+
+    return outputs
+
 def route_after_architect(state: CollaborativeState):
     """Route based on architect's collaboration plan"""
-    strategy = state.collaboration_plan.get("strategy", "code_only")
-    
+    strategy = state.get("collaboration_plan", {}).get("strategy", "code_only")
+
     if strategy == "collaborative":
-        return "sql_analyst"  # Start with SQL analysis
+        # Fan out: SQL analysis and the developer's SQL-independent scaffolding
+        # run concurrently, then developer_integrate joins the two branches
+        return [Send("sql_analyst", state), Send("developer_scaffold", state)]
     elif strategy == "sql_only":
         return "sql_analyst"
     else:  # code_only
         return "developer"
 
-def sql_analyst_step(state: CollaborativeState):
+async def sql_analyst_step(state: CollaborativeState):
     """SQL Analyst analyzes data requirements"""
     
-    # Extract SQL requirements from architect's plan
-    plan_text = str(state.implementation_plan)
-    research_text = state.research_summary
-    original_request = state.implementation_research_scratchpad[-1].content if state.implementation_research_scratchpad else ""
+    # Extract SQL requirements from architect's plan, reusing the renders
+    # produced in enhanced_architect when present
+    plan_text = state.get("rendered_plan_text") or _plan_to_text(state.get("implementation_plan", {}))
+    research_text = state.get("rendered_research_text") or state.get("research_summary", "")
+    original_request = _last_user_content(state)
     
     sql_requirements = f"""
     Original Request: {original_request}
@@ -138,115 +393,254 @@ def sql_analyst_step(state: CollaborativeState):
     Focus on data extraction, performance, and how the results will be used.
     """
     
+    schema_information = state.get("database_schema") or "Schema not provided - create optimal generic queries"
+
+    # Same requirements against the same schema seen recently: reuse the analysis
+    cache_key = _content_cache_key(sql_requirements, schema_information)
+    if not state.get("bypass_cache"):
+        cached = _sql_analyst_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"SQL analyst cache hit for {cache_key}, skipped the analyst LLM graph")
+            return cached
+
     sql_input = {
         "requirements": sql_requirements,
-        "schema_information": state.database_schema or "Schema not provided - create optimal generic queries"
+        "schema_information": schema_information
     }
-    
-    result = sql_analyst.invoke(sql_input)
-    
+
+    result = {}
+    async for snapshot in sql_analyst.astream(
+            sql_input,
+            config={"configurable": {"model_name": pick_model(original_request)}},
+            stream_mode="values"):
+        result = snapshot
+
     # Extract SQL queries for use by developer
     sql_result = result.get('sql_analysis_result')
     queries = [sql_result.query] if sql_result and sql_result.query else []
-    
-    return {
+
+    outputs = {
         "sql_analysis_result": sql_result,
         "sql_queries": queries
     }
+    _sql_analyst_cache.put(cache_key, outputs)
+
+    return outputs
 
 def route_after_sql(state: CollaborativeState):
     """Route after SQL analysis"""
-    strategy = state.collaboration_plan.get("strategy", "code_only")
-    
+    strategy = state.get("collaboration_plan", {}).get("strategy", "code_only")
+
     if strategy == "collaborative":
-        return "developer"  # Now implement the software using SQL results
+        return "developer_integrate"  # Join with the scaffold branch and implement
     else:
         return "end"  # SQL-only task is complete
 
-def developer_step(state: CollaborativeState):
-    """Developer implements software, optionally using SQL results"""
-    
-    # Prepare enhanced context for developer
-    developer_messages = list(state.implementation_research_scratchpad)
-    
+
+# Token budget for the scratchpad re-sent to sub-agents; prompt size stays
+# bounded no matter how long the conversation grows
+_SCRATCHPAD_TOKEN_BUDGET = 4000
+
+
+def _estimate_tokens(message) -> int:
+    # ~4 chars per token is close enough for budgeting without a tokenizer dependency
+    content = message.content
+    if not isinstance(content, str):
+        content = str(content)
+    return len(content) // 4 + 1
+
+
+def _compact_scratchpad(messages, max_tokens=_SCRATCHPAD_TOKEN_BUDGET):
+    """Bound the scratchpad forwarded to sub-agents: keep the first message
+    (the original request) plus the most recent messages that fit the budget,
+    replacing the dropped middle with a single elision note"""
+    if not messages:
+        return messages
+
+    budget = max_tokens - _estimate_tokens(messages[0])
+    kept = []
+    for message in reversed(messages[1:]):
+        cost = _estimate_tokens(message)
+        if cost > budget:
+            break
+        budget -= cost
+        kept.append(message)
+    kept.reverse()
+
+    if len(kept) == len(messages) - 1:
+        return messages
+
+    dropped = len(messages) - 1 - len(kept)
+    elision = AIMessage(content=f"[{dropped} earlier research messages elided to fit the context budget]")
+    return [messages[0], elision] + kept
+
+
+# Memoized last SQL context render, so retries on the same analysis result
+# don't rebuild the (potentially large) f-string. The memo holds the result
+# object itself: keeping it alive makes the identity comparison safe, whereas
+# a bare id() key could collide once the original is garbage-collected
+_sql_context_memo = (None, None)
+
+
+def _sql_context_message(sql_analysis_result) -> AIMessage:
+    """Render the SQL analysis results as developer context"""
+    global _sql_context_memo
+    memo_result, memo_message = _sql_context_memo
+    if memo_result is sql_analysis_result:
+        return memo_message
+
+    sql_context = f"""SQL ANALYSIS RESULTS:
+
+    Query: {sql_analysis_result.query}
+
+    Explanation: {sql_analysis_result.explanation}
+
+    Confidence: {sql_analysis_result.confidence}
+
+    Warnings: {sql_analysis_result.warnings if sql_analysis_result.warnings else 'None'}
+    """
+    message = _message_with_cached_prefix(AIMessage, _SQL_INTEGRATION_INSTRUCTIONS, sql_context)
+    _sql_context_memo = (sql_analysis_result, message)
+    return message
+
+
+def _plan_context_message(state: CollaborativeState) -> AIMessage:
+    """Render the architect's plan as developer context"""
+    plan_context = f"""
+    ARCHITECT'S IMPLEMENTATION PLAN:
+    {state.get("rendered_plan_text") or _plan_to_text(state.get("implementation_plan", {}))}
+
+    COLLABORATION STRATEGY: {state.get("collaboration_plan", {}).get('strategy', 'unknown')}
+    """
+    return AIMessage(content=plan_context)
+
+
+def developer_scaffold(state: CollaborativeState):
+    """Developer branch with no SQL dependency, runs concurrently with sql_analyst.
+    Stages the architect's plan context in the scratchpad so integration starts
+    from a prepared context instead of rebuilding it after the join"""
+    if _plan_is_populated(state.get("implementation_plan")):
+        return {"implementation_research_scratchpad": [_plan_context_message(state)]}
+    return {}
+
+
+async def developer_integrate(state: CollaborativeState):
+    """Join the SQL and scaffold branches and implement using both"""
+    scratchpad = state.get("implementation_research_scratchpad") or []
+    extras = []
+    if state.get("sql_analysis_result"):
+        extras.append(_sql_context_message(state["sql_analysis_result"]))
+
+    plan = state.get("implementation_plan")
+    developer_input = {
+        "implementation_research_scratchpad": list(chain(_compact_scratchpad(scratchpad), extras)),
+        # swe_developer validates with pydantic, hand it builtins
+        "implementation_plan": plan_to_payload(plan) if isinstance(plan, ImplementationPlanStruct) else plan
+    }
+
+    original_request = scratchpad[0].content if scratchpad else ""
+    result = {}
+    async for snapshot in swe_developer.astream(
+            developer_input,
+            config={"configurable": {"model_name": pick_model(original_request)}},
+            stream_mode="values"):
+        result = snapshot
+
+    return result
+
+
+async def developer_step(state: CollaborativeState):
+    """Developer implements software on the single-branch (code_only) path"""
+
+    # Build only the extra context messages; the scratchpad itself is
+    # concatenated lazily instead of copied up front
+    scratchpad = state.get("implementation_research_scratchpad") or []
+    extras = []
+
     # Add SQL context if available
-    if state.sql_analysis_result:
-        sql_context = f"""
-        SQL ANALYSIS RESULTS:
-        
-        Query: {state.sql_analysis_result.query}
-        
-        Explanation: {state.sql_analysis_result.explanation}
-        
-        Confidence: {state.sql_analysis_result.confidence}
-        
-        Warnings: {state.sql_analysis_result.warnings if state.sql_analysis_result.warnings else 'None'}
-        
-        INTEGRATION INSTRUCTIONS:
-        - Use the above SQL query in your implementation
-        - Consider the data structure returned by this query  
-        - Implement proper error handling for database operations
-        - Add data validation and transformation as needed
-        """
-        
-        developer_messages.append(AIMessage(content=sql_context))
-    
+    if state.get("sql_analysis_result"):
+        extras.append(_sql_context_message(state["sql_analysis_result"]))
+
     # Add architect's plan context
-    if state.implementation_plan:
-        plan_context = f"""
-        ARCHITECT'S IMPLEMENTATION PLAN:
-        {str(state.implementation_plan)}
-        
-        COLLABORATION STRATEGY: {state.collaboration_plan.get('strategy', 'unknown')}
-        """
-        developer_messages.append(AIMessage(content=plan_context))
-    
+    plan = state.get("implementation_plan")
+    if _plan_is_populated(plan):
+        extras.append(_plan_context_message(state))
+
     # Call developer with enhanced context
     developer_input = {
-        "implementation_research_scratchpad": developer_messages,
-        "implementation_plan": state.implementation_plan
+        "implementation_research_scratchpad": list(chain(_compact_scratchpad(scratchpad), extras)),
+        # swe_developer validates with pydantic, hand it builtins
+        "implementation_plan": plan_to_payload(plan) if isinstance(plan, ImplementationPlanStruct) else plan
     }
-    
-    result = swe_developer.invoke(developer_input)
-    
+
+    original_request = scratchpad[0].content if scratchpad else ""
+    result = {}
+    async for snapshot in swe_developer.astream(
+            developer_input,
+            config={"configurable": {"model_name": pick_model(original_request)}},
+            stream_mode="values"):
+        result = snapshot
+
     return result
 
-# Create the simplified collaborative workflow
-workflow = StateGraph(CollaborativeState)
+@lru_cache(maxsize=1)
+def _build_agent():
+    """Build and compile the collaborative workflow exactly once per process.
+    Reload-heavy dev loops (LangGraph Studio, autoreload, pytest) reuse the
+    cached compilation instead of re-running graph validation"""
+    workflow = StateGraph(CollaborativeState)
 
-# Add the 3 core agents
-workflow.add_node("architect", enhanced_architect)
-workflow.add_node("sql_analyst", sql_analyst_step)
-workflow.add_node("developer", developer_step)
+    # Add the core agents
+    workflow.add_node("architect", enhanced_architect)
+    workflow.add_node("sql_analyst", sql_analyst_step)
+    workflow.add_node("developer", developer_step)
+    workflow.add_node("developer_scaffold", developer_scaffold)
+    workflow.add_node("developer_integrate", developer_integrate)
 
-# Simple linear flow with conditional routing
-workflow.add_edge(START, "architect")
+    # Simple linear flow with conditional routing
+    workflow.add_edge(START, "architect")
 
-# Architect decides the collaboration strategy
-workflow.add_conditional_edges(
-    "architect",
-    route_after_architect,
-    {
-        "sql_analyst": "sql_analyst",
-        "developer": "developer"
-    }
-)
-
-# After SQL analysis, either go to developer (collaborative) or end (SQL-only)
-workflow.add_conditional_edges(
-    "sql_analyst", 
-    route_after_sql,
-    {
-        "developer": "developer",
-        "end": END
-    }
-)
+    # Architect decides the collaboration strategy; the collaborative strategy
+    # fans out to sql_analyst + developer_scaffold via Send (see route_after_architect)
+    workflow.add_conditional_edges(
+        "architect",
+        route_after_architect
+    )
+
+    # After SQL analysis, either join the scaffold branch (collaborative) or end (SQL-only)
+    workflow.add_conditional_edges(
+        "sql_analyst",
+        route_after_sql,
+        {
+            "developer_integrate": "developer_integrate",
+            "end": END
+        }
+    )
+
+    # The scaffold branch joins the SQL branch at the integration step
+    workflow.add_edge("developer_scaffold", "developer_integrate")
+    workflow.add_edge("developer_integrate", END)
+
+    # Developer is the final step on the single-branch path
+    workflow.add_edge("developer", END)
+
+    return workflow.compile()
 
-# Developer is always the final step
-workflow.add_edge("developer", END)
 
 # Compile the main agent
-swe_agent = workflow.compile()
+swe_agent = _build_agent()
+
+
+async def stream_agent(inputs, **kwargs):
+    """Primary entry point: stream the collaborative workflow token by token"""
+    async for chunk in swe_agent.astream(inputs, stream_mode="messages", **kwargs):
+        yield chunk
+
+
+async def stream_agent_events(inputs, **kwargs):
+    """Event-level stream for UIs that render sub-agent tokens and node progress"""
+    async for event in swe_agent.astream_events(inputs, version="v2", **kwargs):
+        yield event
 
 # Export aliases for backward compatibility
 collaborative_agent = swe_agent
@@ -0,0 +1,45 @@
+"""msgspec mirrors of the implementation-plan entities.
+
+LangGraph checkpointers serialize the collaborative state on every hop; a
+bare dict needs a full Python-level walk per checkpoint, while these structs
+encode and decode in one C pass with inline validation. The shapes mirror
+agent.common.entities so the architect's pydantic output converts losslessly.
+"""
+import msgspec
+
+from agent.common.entities import ImplementationPlan
+
+
+class AtomicTaskStruct(msgspec.Struct, kw_only=True):
+    atomic_task: str = ""
+    additional_context: str = ""
+
+
+class ImplementationTaskStruct(msgspec.Struct, kw_only=True):
+    file_path: str = ""
+    logical_task: str = ""
+    atomic_tasks: list[AtomicTaskStruct] = []
+
+
+class ImplementationPlanStruct(msgspec.Struct, kw_only=True):
+    tasks: list[ImplementationTaskStruct] = []
+
+
+# Shared encoder instance: building one is not free, reuse it
+plan_encoder = msgspec.json.Encoder()
+
+
+def plan_from_payload(payload) -> ImplementationPlanStruct:
+    """Convert an architect plan (pydantic model, dict, or None) into the struct"""
+    if payload is None:
+        return ImplementationPlanStruct()
+    if isinstance(payload, ImplementationPlanStruct):
+        return payload
+    if isinstance(payload, ImplementationPlan):
+        payload = payload.model_dump()
+    return msgspec.convert(payload, ImplementationPlanStruct)
+
+
+def plan_to_payload(plan) -> dict:
+    """Convert the struct back to builtins for consumers that validate with pydantic"""
+    return msgspec.to_builtins(plan)
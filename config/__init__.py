@@ -1,8 +1,8 @@
+import functools
 import importlib
 import os
-import glob
 import logging
-from os.path import join, dirname, basename, isfile
+import re
 
 from config.shared import Shared
 from src.utils.credentials import get_credentials
@@ -12,24 +12,33 @@ logger = logging.getLogger(__name__)
 
 env = os.getenv('ENVIRONMENT', 'development')
 
-modules = glob.glob(join(dirname(__file__), "*.py"))
-supported_env = [basename(f)[:-3] for f in modules if
-                 isfile(f) and not f.endswith('__init__.py') and 'shared' not in f]
+# The environment modules in this package; a static whitelist avoids a
+# filesystem scan on every import (add new env modules here)
+_SUPPORTED_ENVS = frozenset({"development", "production"})
 
-assert env in supported_env, f"Not supported env: {env}"
+assert env in _SUPPORTED_ENVS, f"Not supported env: {env}"
 
 env_conf = importlib.import_module("." + env, 'config')
 
 
+_BOOL_STRINGS = frozenset(('True', 'true', 'False', 'false'))
+
+
+@functools.lru_cache(maxsize=None)
+def _public_attr_names(cls):
+    # dir() is slow and includes dunders; compute the public names once per class
+    return tuple(name for name in dir(cls) if not name.startswith('__'))
+
+
 def convert_class_to_json(obj):
-    return {name: getattr(obj, name) for name in dir(obj) if not name.startswith('__')}
+    return {name: getattr(obj, name) for name in _public_attr_names(type(obj))}
 
 
 def convert_str_to_org_type(env_variable):
-    if env_variable.isdigit():
+    if env_variable in _BOOL_STRINGS:
+        return env_variable in ('True', 'true')
+    elif env_variable.isdigit():
         return int(env_variable)
-    elif env_variable in ['True', 'true', 'False', 'false']:
-        return env_variable in ['True', 'true']
     return env_variable
 
 
@@ -43,8 +52,7 @@ class GenericConf:
 
 shared_config = Shared()
 env_conf = env_conf.Conf()
-os_env = dict((k.lower(), v) if not v.isdigit() and v not in ['True', 'true', 'False', 'false'] else
-              (k.lower(), convert_str_to_org_type(v)) for k, v in dict(os.environ).items())
+os_env = {k.lower(): convert_str_to_org_type(v) for k, v in os.environ.items()}
 
 try:
     if os.environ.get('TOKEN'):
@@ -61,4 +69,26 @@ except Exception as e:
     cfg = GenericConf([shared_config, env_conf, os_env])
 
 logger.info(f"Configuration loaded for environment: {env}")
-print(cfg)
+
+# Keyword variants per category, including plural/derived forms. Single
+# source for every keyword classifier (the graph's routing regexes/automaton
+# and pick_model below) so the matchers cannot diverge
+SQL_KEYWORDS = ('sql', 'query', 'queries', 'database', 'databases', 'data analysis',
+                'analytics', 'dashboard', 'dashboards', 'report', 'reports', 'reporting')
+CODE_KEYWORDS = ('implement', 'implements', 'implementing', 'implementation', 'implementations',
+                 'develop', 'develops', 'developing', 'development', 'developer', 'developers',
+                 'code', 'codes', 'coding', 'application', 'applications', 'api', 'apis',
+                 'web', 'software')
+
+# Requests shorter than this whose keywords already classify them are simple
+# enough for the lightweight model
+_SIMPLE_REQUEST_MAX_CHARS = 400
+_KNOWN_KEYWORDS_RE = re.compile(
+    r'\b(%s)\b' % '|'.join(SQL_KEYWORDS + CODE_KEYWORDS), re.IGNORECASE)
+
+
+def pick_model(text: str) -> str:
+    """Route short, clearly-classified request text to the cheaper model"""
+    if len(text) < _SIMPLE_REQUEST_MAX_CHARS and _KNOWN_KEYWORDS_RE.search(text):
+        return cfg.MODEL_NAME_SIMPLE
+    return cfg.MODEL_NAME
@@ -3,6 +3,7 @@ import os
 class Shared(object):
     DOMAIN = "usage_ai"
     MODEL_NAME = "gpt-4o"
+    MODEL_NAME_SIMPLE = "gpt-4o-mini"
     vault_config_key = "secret/bdnd/bedrock_agent"
     
     # API Keys
@@ -19,6 +20,8 @@ class Shared(object):
     # Other agent settings
     MAX_RETRIES = 2
     TIMEOUT = 50
+    ARCHITECT_CACHE_ENABLED = True
+    SQL_CACHE_TTL = 3600
     
     # Authentication settings
     DEBUG = True